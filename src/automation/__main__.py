@@ -5,7 +5,7 @@ import argparse
 import json
 from pathlib import Path
 
-from .workflow import run_workflow
+from .workflow import run_workflow, summarize_output
 
 
 def parse_args() -> argparse.Namespace:
@@ -19,31 +19,7 @@ def parse_args() -> argparse.Namespace:
 def main() -> None:
     args = parse_args()
     output = run_workflow(str(args.base_path), str(args.scenario), str(args.media))
-    summary = {
-        "prompts": [prompt.payload for prompt in output.prompts],
-        "renders": [job.artifact_path for job in output.renders],
-        "exports": [result.output_path for result in output.exports],
-        "seo": output.seo_copy,
-        "schedule": [
-            {
-                "platform": item.platform,
-                "publish_time": item.publish_time.isoformat(),
-                "reminder_time": item.reminder_time.isoformat(),
-            }
-            for item in output.schedule
-        ],
-        "engagement": [
-            {
-                "platform": task.platform,
-                "action": task.action,
-                "scheduled_for": task.scheduled_for.isoformat(),
-            }
-            for task in output.engagement_tasks
-        ],
-        "analytics": output.analytics_snapshot,
-        "publication_log": output.publication_log,
-    }
-    print(json.dumps(summary, indent=2))
+    print(json.dumps(summarize_output(output), indent=2))
 
 
 if __name__ == "__main__":
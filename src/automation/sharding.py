@@ -0,0 +1,572 @@
+"""Coordinator-free sharded execution of the workflow across several hosts.
+
+Every host points at the same work directory (for example an NFS mount)::
+
+    work_dir/
+    ├── tasks/    # one JSON file per scenario/media pair
+    ├── leases/   # ``<task_id>.<generation>.lease`` claims refreshed by heartbeats
+    ├── results/  # one JSON file per finished task, written exactly once
+    └── shards/   # per-worker summaries consumed by ``merge``
+
+Files are always written to a temporary name first and then published with
+``os.link`` (create-if-absent) or ``os.replace`` so readers never observe a
+partially written file. Lease expiry compares heartbeat timestamps written by
+other hosts, so host clocks are expected to be reasonably in sync.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .workflow import run_workflow, summarize_output
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ShardTask:
+    """A single scenario/media pair to be executed by one worker."""
+
+    task_id: str
+    scenario: str
+    media: str
+
+
+@dataclass
+class Lease:
+    """Claim held by a worker on one generation of a task's lease.
+
+    Every claim creates a new generation file exclusively; the highest
+    generation on disk is the current lease. Only the creator ever rewrites a
+    generation file, so a lease can be lost but never overwritten.
+    """
+
+    task_id: str
+    worker_id: str
+    generation: int
+    heartbeat: float
+    ttl_seconds: float
+    failures: int = 0
+    released: bool = False
+    retry_pending: bool = False
+    stolen_from: Optional[str] = None
+
+    def is_expired(self, now: Optional[float] = None) -> bool:
+        current = time.time() if now is None else now
+        return current - self.heartbeat > self.ttl_seconds
+
+
+@dataclass
+class ShardReport:
+    """Outcome of a single worker run, persisted under ``shards/``."""
+
+    worker_id: str
+    run_id: str = field(default_factory=lambda: uuid.uuid4().hex[:8])
+    completed: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+    stolen: List[str] = field(default_factory=list)
+    duplicates: List[str] = field(default_factory=list)
+    abandoned: List[str] = field(default_factory=list)
+    retried: List[str] = field(default_factory=list)
+    timed_out: List[str] = field(default_factory=list)
+
+
+def make_task_id(scenario: str, media: str) -> str:
+    """Derive a stable identifier so every host plans the same task names."""
+
+    digest = hashlib.sha1(f"{scenario}\0{media}".encode("utf-8")).hexdigest()
+    return digest[:16]
+
+
+def load_manifest(manifest_file: Path) -> List[Tuple[str, str]]:
+    """Read ``scenario,media`` pairs from a CSV manifest."""
+
+    with manifest_file.open("r", encoding="utf-8") as handle:
+        reader = csv.DictReader(handle)
+        return [(row["scenario"].strip(), row["media"].strip()) for row in reader]
+
+
+class ShardWorkspace:
+    """File-based task queue shared by every worker through a common directory."""
+
+    def __init__(self, root: Path, clock: Callable[[], float] = time.time) -> None:
+        self.root = root
+        self.clock = clock
+        self.tasks_dir = root / "tasks"
+        self.leases_dir = root / "leases"
+        self.results_dir = root / "results"
+        self.shards_dir = root / "shards"
+        for directory in (self.tasks_dir, self.leases_dir, self.results_dir, self.shards_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+    def plan(self, pairs: Iterable[Tuple[str, str]]) -> List[ShardTask]:
+        """Register tasks for the given pairs; safe to repeat from any host."""
+
+        tasks: List[ShardTask] = []
+        for scenario, media in pairs:
+            task = ShardTask(task_id=make_task_id(scenario, media), scenario=scenario, media=media)
+            self._create_exclusive(self.tasks_dir / f"{task.task_id}.json", asdict(task))
+            tasks.append(task)
+        return tasks
+
+    def load_tasks(self) -> List[ShardTask]:
+        return [
+            ShardTask(**self._read_json(path))
+            for path in sorted(self.tasks_dir.glob("*.json"))
+        ]
+
+    def has_result(self, task_id: str) -> bool:
+        return (self.results_dir / f"{task_id}.json").exists()
+
+    def result_ids(self) -> Set[str]:
+        return {
+            entry.name[: -len(".json")]
+            for entry in os.scandir(self.results_dir)
+            if entry.name.endswith(".json") and not entry.name.startswith(".")
+        }
+
+    def load_results(self) -> Dict[str, Dict[str, Any]]:
+        return {path.stem: self._read_json(path) for path in sorted(self.results_dir.glob("*.json"))}
+
+    def write_result(self, task_id: str, payload: Dict[str, Any]) -> bool:
+        """Publish a task result; returns ``False`` if another worker got there first."""
+
+        return self._create_exclusive(self.results_dir / f"{task_id}.json", payload)
+
+    def clear_failed(self, worker_id: str = "retry-failed") -> List[str]:
+        """Delete failed results so the tasks can run again.
+
+        Each task gets a fresh released lease generation with its failure count
+        reset, so generation numbers keep increasing and a stale holder of an
+        older generation can never believe it owns the task again.
+        """
+
+        cleared: List[str] = []
+        for task_id, result in self.load_results().items():
+            if result.get("status") != "failed":
+                continue
+            while True:
+                current = self.read_lease(task_id)
+                reset = Lease(
+                    task_id=task_id,
+                    worker_id=worker_id,
+                    generation=0 if current is None else current.generation + 1,
+                    heartbeat=self.clock(),
+                    ttl_seconds=0 if current is None else current.ttl_seconds,
+                    released=True,
+                )
+                if self._create_exclusive(self._lease_path(task_id, reset.generation), asdict(reset)):
+                    break
+            (self.results_dir / f"{task_id}.json").unlink(missing_ok=True)
+            cleared.append(task_id)
+        return cleared
+
+    def write_shard_report(self, report: ShardReport) -> None:
+        self._replace(self.shards_dir / f"{report.worker_id}-{report.run_id}.json", asdict(report))
+
+    def load_shard_reports(self) -> List[ShardReport]:
+        return [
+            ShardReport(**self._read_json(path))
+            for path in sorted(self.shards_dir.glob("*.json"))
+        ]
+
+    def lease_generations(self) -> Dict[str, int]:
+        """Return the current generation of every lease with a single directory scan."""
+
+        generations: Dict[str, int] = {}
+        for entry in os.scandir(self.leases_dir):
+            parsed = self._parse_lease_name(entry.name)
+            if parsed is not None:
+                task_id, generation = parsed
+                generations[task_id] = max(generation, generations.get(task_id, -1))
+        return generations
+
+    def current_generation(self, task_id: str) -> Optional[int]:
+        generations = []
+        for path in self.leases_dir.glob(f"{task_id}.*.lease"):
+            parsed = self._parse_lease_name(path.name)
+            if parsed is not None and parsed[0] == task_id:
+                generations.append(parsed[1])
+        return max(generations, default=None)
+
+    def read_lease(self, task_id: str, generation: Optional[int] = None) -> Optional[Lease]:
+        if generation is None:
+            generation = self.current_generation(task_id)
+            if generation is None:
+                return None
+        try:
+            return Lease(**self._read_json(self._lease_path(task_id, generation)))
+        except FileNotFoundError:
+            return None
+
+    def is_claimable(self, lease: Lease) -> bool:
+        return lease.released or lease.is_expired(self.clock())
+
+    def acquire(self, task_id: str, worker_id: str, ttl_seconds: float) -> Optional[Lease]:
+        """Claim a task, stealing it if the current holder stopped heartbeating."""
+
+        return self.claim(task_id, worker_id, ttl_seconds, self.read_lease(task_id))
+
+    def claim(
+        self, task_id: str, worker_id: str, ttl_seconds: float, current: Optional[Lease]
+    ) -> Optional[Lease]:
+        """Create the generation after ``current``; fails if anyone else already did."""
+
+        if current is not None and not self.is_claimable(current):
+            return None
+        lease = Lease(
+            task_id=task_id,
+            worker_id=worker_id,
+            generation=0 if current is None else current.generation + 1,
+            heartbeat=self.clock(),
+            ttl_seconds=ttl_seconds,
+        )
+        if current is not None:
+            lease.failures = current.failures
+            if not current.released and not current.retry_pending:
+                # The previous holder crashed or stalled; that counts as an attempt.
+                lease.failures += 1
+                if current.worker_id != worker_id:
+                    lease.stolen_from = current.worker_id
+        if self._create_exclusive(self._lease_path(task_id, lease.generation), asdict(lease)):
+            return lease
+        return None
+
+    def holds(self, lease: Lease) -> bool:
+        return self.current_generation(lease.task_id) == lease.generation
+
+    def update(self, lease: Lease) -> bool:
+        """Rewrite the holder's own generation; returns ``False`` once a newer one exists."""
+
+        if not self.holds(lease):
+            return False
+        self._replace(self._lease_path(lease.task_id, lease.generation), asdict(lease))
+        # A steal may have landed between the check and the write; the newer
+        # generation wins regardless of what was just written.
+        return self.holds(lease)
+
+    def renew(self, lease: Lease) -> bool:
+        """Refresh the heartbeat; returns ``False`` once a newer generation exists."""
+
+        lease.heartbeat = self.clock()
+        return self.update(lease)
+
+    def release(self, lease: Lease) -> None:
+        lease.released = True
+        self.update(lease)
+
+    def _lease_path(self, task_id: str, generation: int) -> Path:
+        return self.leases_dir / f"{task_id}.{generation}.lease"
+
+    @staticmethod
+    def _parse_lease_name(name: str) -> Optional[Tuple[str, int]]:
+        parts = name.split(".")
+        if len(parts) != 3 or parts[2] != "lease" or not parts[0] or not parts[1].isdigit():
+            return None
+        return parts[0], int(parts[1])
+
+    @staticmethod
+    def _read_json(path: Path) -> Dict[str, Any]:
+        with path.open("r", encoding="utf-8") as handle:
+            return json.load(handle)
+
+    @staticmethod
+    def _write_temp(path: Path, payload: Dict[str, Any]) -> Path:
+        temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        with temp_path.open("w", encoding="utf-8") as handle:
+            json.dump(payload, handle, indent=2)
+            handle.flush()
+            os.fsync(handle.fileno())
+        return temp_path
+
+    def _create_exclusive(self, path: Path, payload: Dict[str, Any]) -> bool:
+        temp_path = self._write_temp(path, payload)
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            return False
+        finally:
+            temp_path.unlink(missing_ok=True)
+        return True
+
+    def _replace(self, path: Path, payload: Dict[str, Any]) -> None:
+        os.replace(self._write_temp(path, payload), path)
+
+
+class _Heartbeat(threading.Thread):
+    """Keeps a lease alive while its task is running, up to ``deadline``.
+
+    Past the deadline the heartbeat stops renewing so a hung task's lease
+    expires; the worker taking it over counts the attempt.
+    """
+
+    def __init__(
+        self, workspace: ShardWorkspace, lease: Lease, interval: float, deadline: Optional[float] = None
+    ) -> None:
+        super().__init__(daemon=True)
+        self.workspace = workspace
+        self.lease = lease
+        self.interval = interval
+        self.deadline = deadline
+        self.lost = False
+        self.timed_out = False
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            if self.deadline is not None and self.workspace.clock() >= self.deadline:
+                logger.warning("Task %s exceeded its timeout, letting the lease expire", self.lease.task_id)
+                self.timed_out = True
+                return
+            try:
+                renewed = self.workspace.renew(self.lease)
+            except OSError as exc:
+                logger.warning("Heartbeat for task %s failed, retrying: %s", self.lease.task_id, exc)
+                continue
+            if not renewed:
+                self.lost = True
+                return
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+
+class ShardWorker:
+    """Claims pending tasks from a shared workspace and executes the workflow.
+
+    The task list is read once at start-up; tasks planned afterwards are picked
+    up by workers started later. A task that raises, times out or whose
+    worker dies is retried by whichever worker next claims its expired lease,
+    and only recorded as ``failed`` after ``max_attempts`` attempts.
+    ``task_timeout`` defaults to ten lease TTLs.
+    """
+
+    def __init__(
+        self,
+        workspace: ShardWorkspace,
+        base_path: Path,
+        worker_id: Optional[str] = None,
+        lease_ttl: float = 60.0,
+        poll_interval: float = 1.0,
+        max_attempts: int = 3,
+        task_timeout: Optional[float] = None,
+    ) -> None:
+        self.workspace = workspace
+        self.base_path = base_path
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = lease_ttl / 3
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.task_timeout = lease_ttl * 10 if task_timeout is None else task_timeout
+        self.report = ShardReport(worker_id=self.worker_id)
+
+    def run(self) -> ShardReport:
+        """Work until every planned task has a result, stealing from stalled workers."""
+
+        tasks = self.workspace.load_tasks()
+        # Start each worker at a different point so they do not contend for the same head tasks.
+        offset = int(hashlib.sha1(self.worker_id.encode("utf-8")).hexdigest()[:8], 16)
+        while True:
+            try:
+                finished = self.workspace.result_ids()
+                pending = [task for task in tasks if task.task_id not in finished]
+                if not pending:
+                    break
+                start = offset % len(pending)
+                claimed = self._claim_next(pending[start:] + pending[:start])
+            except OSError as exc:
+                logger.warning("Shared directory unavailable, retrying: %s", exc)
+                claimed = False
+            if not claimed:
+                time.sleep(self.poll_interval)
+        self._save_report()
+        return self.report
+
+    def _claim_next(self, pending: List[ShardTask]) -> bool:
+        generations = self.workspace.lease_generations()
+        for task in pending:
+            current = None
+            if task.task_id in generations:
+                current = self.workspace.read_lease(task.task_id, generations[task.task_id])
+                if current is not None and not self.workspace.is_claimable(current):
+                    continue
+            lease = self.workspace.claim(task.task_id, self.worker_id, self.lease_ttl, current)
+            if lease is not None:
+                try:
+                    self._process(task, lease)
+                except OSError as exc:
+                    # Leave the lease to expire so the task is picked up again.
+                    logger.warning("Giving up task %s after shared directory error: %s", task.task_id, exc)
+                    self.report.abandoned.append(task.task_id)
+                    self._save_report()
+                return True
+        return False
+
+    def _process(self, task: ShardTask, lease: Lease) -> None:
+        if self.workspace.has_result(task.task_id):
+            self.workspace.release(lease)
+            return
+        if lease.stolen_from is not None:
+            self.report.stolen.append(task.task_id)
+        if lease.failures >= self.max_attempts:
+            self._publish(
+                task,
+                lease,
+                status="failed",
+                attempts=lease.failures,
+                error="Worker stalled or crashed on every attempt",
+            )
+            return
+
+        deadline = self.workspace.clock() + self.task_timeout
+        heartbeat = _Heartbeat(self.workspace, lease, self.heartbeat_interval, deadline)
+        heartbeat.start()
+        error: Optional[Exception] = None
+        try:
+            summary = self._execute(task)
+        except Exception as exc:  # noqa: BLE001 - counted towards max_attempts below
+            error = exc
+        finally:
+            heartbeat.stop()
+
+        if heartbeat.timed_out:
+            self.report.timed_out.append(task.task_id)
+            self._save_report()
+            return
+        try:
+            still_held = not heartbeat.lost and self.workspace.holds(lease)
+        except OSError:
+            still_held = False
+        if not still_held:
+            # Another worker owns the task now; its result is the one that counts.
+            self.report.abandoned.append(task.task_id)
+            self._save_report()
+            return
+
+        if error is None:
+            self._publish(task, lease, status="complete", summary=summary)
+            return
+        lease.failures += 1
+        if lease.failures >= self.max_attempts:
+            self._publish(
+                task, lease, status="failed", attempts=lease.failures, error=f"{type(error).__name__}: {error}"
+            )
+            return
+        # Keep the lease unreleased so the retry waits for it to expire.
+        lease.retry_pending = True
+        if self.workspace.renew(lease):
+            self.report.retried.append(task.task_id)
+        else:
+            self.report.abandoned.append(task.task_id)
+        self._save_report()
+
+    def _publish(self, task: ShardTask, lease: Lease, **outcome: Any) -> None:
+        payload: Dict[str, Any] = {
+            "task_id": task.task_id,
+            "scenario": task.scenario,
+            "media": task.media,
+            "worker_id": self.worker_id,
+            **outcome,
+        }
+        if self.workspace.write_result(task.task_id, payload):
+            bucket = self.report.completed if payload["status"] == "complete" else self.report.failed
+            bucket.append(task.task_id)
+        else:
+            self.report.duplicates.append(task.task_id)
+        self.workspace.release(lease)
+        self._save_report()
+
+    def _save_report(self) -> None:
+        try:
+            self.workspace.write_shard_report(self.report)
+        except OSError as exc:
+            logger.warning("Could not write shard report for %s: %s", self.worker_id, exc)
+
+    def _execute(self, task: ShardTask) -> Dict[str, Any]:
+        output = run_workflow(str(self.base_path), task.scenario, task.media)
+        return summarize_output(output)
+
+
+def merge_shards(workspace: ShardWorkspace) -> Dict[str, Any]:
+    """Assemble results and per-shard summaries into a single report."""
+
+    tasks = workspace.load_tasks()
+    results = workspace.load_results()
+    return {
+        "tasks": len(tasks),
+        "completed": sum(1 for result in results.values() if result["status"] == "complete"),
+        "failed": sum(1 for result in results.values() if result["status"] == "failed"),
+        "missing": [task.task_id for task in tasks if task.task_id not in results],
+        "shards": [asdict(report) for report in workspace.load_shard_reports()],
+        "results": [results[task.task_id] for task in tasks if task.task_id in results],
+    }
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the automation workflow sharded across hosts")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    plan = subparsers.add_parser("plan", help="Register scenario/media pairs as tasks")
+    plan.add_argument("work_dir", type=Path, help="Shared work directory")
+    plan.add_argument("manifest", type=Path, help="CSV file with scenario,media columns")
+    plan.add_argument("--retry-failed", action="store_true", help="Delete failed results so they run again")
+
+    work = subparsers.add_parser("work", help="Claim and execute pending tasks")
+    work.add_argument("work_dir", type=Path, help="Shared work directory")
+    work.add_argument("--base-path", type=Path, default=Path("."), help="Base path for assets")
+    work.add_argument("--worker-id", default=None, help="Unique worker name (defaults to host-pid)")
+    work.add_argument("--lease-ttl", type=float, default=60.0, help="Seconds before a silent lease may be stolen")
+    work.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to wait when no task is claimable")
+    work.add_argument("--max-attempts", type=int, default=3, help="Failures before a task is recorded as failed")
+    work.add_argument(
+        "--task-timeout", type=float, default=None, help="Seconds before a hung task's lease is left to expire"
+    )
+
+    merge = subparsers.add_parser("merge", help="Combine shard summaries into one report")
+    merge.add_argument("work_dir", type=Path, help="Shared work directory")
+    merge.add_argument("--output", type=Path, default=None, help="Write the report to a file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    args = parse_args(argv)
+    workspace = ShardWorkspace(args.work_dir)
+    if args.command == "plan":
+        tasks = workspace.plan(load_manifest(args.manifest))
+        if args.retry_failed:
+            workspace.clear_failed()
+        print(json.dumps([asdict(task) for task in tasks], indent=2))
+    elif args.command == "work":
+        worker = ShardWorker(
+            workspace,
+            args.base_path,
+            worker_id=args.worker_id,
+            lease_ttl=args.lease_ttl,
+            poll_interval=args.poll_interval,
+            max_attempts=args.max_attempts,
+            task_timeout=args.task_timeout,
+        )
+        print(json.dumps(asdict(worker.run()), indent=2))
+    else:
+        report = json.dumps(merge_shards(workspace), indent=2)
+        if args.output is not None:
+            args.output.write_text(report, encoding="utf-8")
+        else:
+            print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Iterable, List
+from typing import Any, Dict, Iterable, List
 
 from .analytics import AnalyticsTracker
 from .data_collection import DataCollector, MediaAsset, Scenario
@@ -81,3 +81,32 @@ class AutomationWorkflow:
 def run_workflow(base_path: str, scenario_file: str, media_file: str) -> WorkflowOutput:
     workflow = AutomationWorkflow(Path(base_path))
     return workflow.execute(Path(scenario_file), Path(media_file))
+
+
+def summarize_output(output: WorkflowOutput) -> Dict[str, Any]:
+    """Return a JSON-serialisable summary of a workflow run."""
+
+    return {
+        "prompts": [prompt.payload for prompt in output.prompts],
+        "renders": [job.artifact_path for job in output.renders],
+        "exports": [result.output_path for result in output.exports],
+        "seo": output.seo_copy,
+        "schedule": [
+            {
+                "platform": item.platform,
+                "publish_time": item.publish_time.isoformat(),
+                "reminder_time": item.reminder_time.isoformat(),
+            }
+            for item in output.schedule
+        ],
+        "engagement": [
+            {
+                "platform": task.platform,
+                "action": task.action,
+                "scheduled_for": task.scheduled_for.isoformat(),
+            }
+            for task in output.engagement_tasks
+        ],
+        "analytics": output.analytics_snapshot,
+        "publication_log": output.publication_log,
+    }
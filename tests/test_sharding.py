@@ -0,0 +1,366 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+from automation import sharding
+from automation.sharding import ShardWorker, ShardWorkspace, _Heartbeat, merge_shards
+
+SRC_PATH = Path(__file__).resolve().parents[1] / "src"
+
+
+def _write_inputs(base: Path, count: int) -> list:
+    pairs = []
+    for idx in range(count):
+        (base / f"scenario_{idx}.json").write_text(
+            json.dumps(
+                {
+                    "name": f"Campaign {idx}",
+                    "goals": ["Goal"],
+                    "target_audience": ["Audience"],
+                    "tone": "Upbeat",
+                    "platforms": ["youtube"],
+                    "call_to_action": "Act now",
+                }
+            )
+        )
+        pairs.append((f"scenario_{idx}.json", "media.csv"))
+    (base / "media.csv").write_text("asset_id,description,tags\nA1,Clip,sample|tag")
+    return pairs
+
+
+def test_plan_is_idempotent(tmp_path: Path) -> None:
+    pairs = _write_inputs(tmp_path, 2)
+    workspace = ShardWorkspace(tmp_path / "work")
+
+    first = workspace.plan(pairs)
+    second = ShardWorkspace(tmp_path / "work").plan(pairs)
+
+    assert [task.task_id for task in first] == [task.task_id for task in second]
+    assert len(workspace.load_tasks()) == 2
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def test_lease_is_exclusive_until_expired(tmp_path: Path) -> None:
+    clock = FakeClock()
+    workspace = ShardWorkspace(tmp_path, clock=clock)
+
+    lease = workspace.acquire("task", "worker-a", ttl_seconds=30)
+    assert lease is not None
+    assert workspace.acquire("task", "worker-b", ttl_seconds=30) is None
+
+    clock.advance(31)
+    stolen = workspace.acquire("task", "worker-b", ttl_seconds=30)
+
+    assert stolen is not None
+    assert stolen.stolen_from == "worker-a"
+    assert stolen.generation == lease.generation + 1
+    assert not workspace.renew(lease)
+    assert workspace.renew(stolen)
+
+
+def test_only_one_worker_wins_concurrent_steal(tmp_path: Path) -> None:
+    clock = FakeClock()
+    workspace = ShardWorkspace(tmp_path, clock=clock)
+    assert workspace.acquire("task", "worker-a", ttl_seconds=30) is not None
+    clock.advance(31)
+
+    stale = workspace.read_lease("task")
+    first = workspace.claim("task", "worker-b", 30, stale)
+    second = workspace.claim("task", "worker-c", 30, stale)
+
+    assert first is not None
+    assert second is None
+    assert workspace.read_lease("task").worker_id == "worker-b"
+
+
+def test_steal_during_renew_is_not_overwritten(tmp_path: Path, monkeypatch) -> None:
+    clock = FakeClock()
+    workspace = ShardWorkspace(tmp_path, clock=clock)
+    lease = workspace.acquire("task", "worker-a", ttl_seconds=30)
+    clock.advance(31)
+    thief = {}
+    original_replace = workspace._replace
+
+    def steal_then_replace(path, payload):
+        # Worker B steals after A's ownership check but before A's write.
+        thief["lease"] = workspace.acquire("task", "worker-b", ttl_seconds=30)
+        original_replace(path, payload)
+
+    monkeypatch.setattr(workspace, "_replace", steal_then_replace)
+    assert not workspace.renew(lease)
+    monkeypatch.setattr(workspace, "_replace", original_replace)
+
+    assert thief["lease"] is not None
+    assert workspace.read_lease("task").worker_id == "worker-b"
+    assert workspace.renew(thief["lease"])
+
+
+def test_live_lease_is_never_taken_away(tmp_path: Path) -> None:
+    clock = FakeClock()
+    workspace = ShardWorkspace(tmp_path, clock=clock)
+    lease = workspace.acquire("task", "worker-a", ttl_seconds=30)
+
+    for contender in ("worker-b", "worker-c", "worker-d"):
+        clock.advance(20)
+        assert workspace.acquire("task", contender, ttl_seconds=30) is None
+        assert workspace.renew(lease)
+
+
+def test_heartbeat_survives_transient_renew_errors(tmp_path: Path, monkeypatch) -> None:
+    workspace = ShardWorkspace(tmp_path)
+    lease = workspace.acquire("task", "worker-a", ttl_seconds=30)
+    calls = []
+    renewed = threading.Event()
+    original_renew = workspace.renew
+
+    def flaky_renew(target):
+        calls.append(target)
+        if len(calls) == 1:
+            raise OSError("stale NFS file handle")
+        renewed.set()
+        return original_renew(target)
+
+    monkeypatch.setattr(workspace, "renew", flaky_renew)
+    heartbeat = _Heartbeat(workspace, lease, interval=0.001)
+    heartbeat.start()
+    assert renewed.wait(timeout=10)
+    heartbeat.stop()
+
+    assert not heartbeat.lost
+
+
+def test_worker_steals_stalled_task_and_writes_result_once(tmp_path: Path) -> None:
+    pairs = _write_inputs(tmp_path, 2)
+    clock = FakeClock()
+    workspace = ShardWorkspace(tmp_path / "work", clock=clock)
+    tasks = workspace.plan(pairs)
+    assert workspace.acquire(tasks[0].task_id, "crashed", ttl_seconds=30) is not None
+    clock.advance(31)
+
+    report = ShardWorker(workspace, tmp_path, worker_id="survivor", poll_interval=0).run()
+
+    assert sorted(report.completed) == sorted(task.task_id for task in tasks)
+    assert report.stolen == [tasks[0].task_id]
+    assert not workspace.write_result(tasks[0].task_id, {"status": "complete"})
+
+
+def test_worker_drops_result_after_losing_lease(tmp_path: Path) -> None:
+    pairs = _write_inputs(tmp_path, 1)
+    clock = FakeClock()
+    workspace = ShardWorkspace(tmp_path / "work", clock=clock)
+    (task,) = workspace.plan(pairs)
+    worker = ShardWorker(workspace, tmp_path, worker_id="slow")
+    lease = workspace.acquire(task.task_id, "slow", ttl_seconds=30)
+
+    def stolen_mid_run(_task):
+        clock.advance(31)
+        assert workspace.acquire(task.task_id, "thief", ttl_seconds=30) is not None
+        return {}
+
+    worker._execute = stolen_mid_run
+    worker._process(task, lease)
+
+    assert worker.report.abandoned == [task.task_id]
+    assert not workspace.has_result(task.task_id)
+
+
+def test_failures_are_retried_before_being_recorded(tmp_path: Path, monkeypatch) -> None:
+    pairs = _write_inputs(tmp_path, 1)
+    clock = FakeClock()
+    workspace = ShardWorkspace(tmp_path / "work", clock=clock)
+    (task,) = workspace.plan(pairs)
+    monkeypatch.setattr(sharding.time, "sleep", clock.advance)
+    worker = ShardWorker(workspace, tmp_path, worker_id="unlucky", lease_ttl=30, poll_interval=10, max_attempts=2)
+    attempts = []
+
+    def always_fail(_task):
+        attempts.append(_task.task_id)
+        raise OSError("share unavailable")
+
+    worker._execute = always_fail
+    report = worker.run()
+
+    assert len(attempts) == 2
+    assert report.retried == [task.task_id]
+    assert report.failed == [task.task_id]
+    assert report.stolen == []
+    assert workspace.load_results()[task.task_id]["attempts"] == 2
+
+    previous = workspace.read_lease(task.task_id).generation
+    assert workspace.clear_failed() == [task.task_id]
+    assert not workspace.has_result(task.task_id)
+    retry = workspace.acquire(task.task_id, "next", ttl_seconds=30)
+    assert retry.generation == previous + 2
+    assert retry.failures == 0
+    assert retry.stolen_from is None
+
+
+def test_stale_holder_cannot_renew_after_retry_failed(tmp_path: Path) -> None:
+    clock = FakeClock()
+    workspace = ShardWorkspace(tmp_path, clock=clock)
+    stalled = workspace.acquire("task", "A", ttl_seconds=30)
+    clock.advance(31)
+    thief = workspace.acquire("task", "B", ttl_seconds=30)
+    assert workspace.write_result("task", {"task_id": "task", "status": "failed"})
+    workspace.release(thief)
+
+    assert workspace.clear_failed() == ["task"]
+    fresh = workspace.acquire("task", "C", ttl_seconds=30)
+
+    assert fresh is not None
+    assert not workspace.renew(stalled)
+    assert not workspace.holds(stalled)
+    assert workspace.holds(fresh)
+    assert workspace.read_lease("task").worker_id == "C"
+
+
+def test_takeover_of_unreleased_lease_counts_as_attempt(tmp_path: Path) -> None:
+    pairs = _write_inputs(tmp_path, 1)
+    clock = FakeClock()
+    workspace = ShardWorkspace(tmp_path / "work", clock=clock)
+    (task,) = workspace.plan(pairs)
+    for crashed in ("crash-1", "crash-2"):
+        assert workspace.acquire(task.task_id, crashed, ttl_seconds=30) is not None
+        clock.advance(31)
+    worker = ShardWorker(workspace, tmp_path, worker_id="survivor", poll_interval=0, max_attempts=2)
+    worker._execute = lambda _task: pytest.fail("exhausted task must not run again")
+
+    report = worker.run()
+
+    assert report.failed == [task.task_id]
+    assert report.stolen == [task.task_id]
+    assert workspace.load_results()[task.task_id]["attempts"] == 2
+
+
+def test_hung_task_stops_heartbeat_and_lets_lease_expire(tmp_path: Path) -> None:
+    pairs = _write_inputs(tmp_path, 1)
+    clock = FakeClock()
+    workspace = ShardWorkspace(tmp_path / "work", clock=clock)
+    (task,) = workspace.plan(pairs)
+    worker = ShardWorker(workspace, tmp_path, worker_id="hung", lease_ttl=30, task_timeout=60)
+    worker.heartbeat_interval = 0.001
+    lease = workspace.acquire(task.task_id, "hung", ttl_seconds=30)
+    taken_over = {}
+
+    def hang(_task):
+        clock.advance(61)
+        for thread in threading.enumerate():
+            if isinstance(thread, _Heartbeat):
+                thread.join(timeout=10)
+        taken_over["lease"] = workspace.acquire(task.task_id, "rescuer", ttl_seconds=30)
+        return {}
+
+    worker._execute = hang
+    worker._process(task, lease)
+
+    assert worker.report.timed_out == [task.task_id]
+    assert not workspace.has_result(task.task_id)
+    assert taken_over["lease"].stolen_from == "hung"
+    assert taken_over["lease"].failures == 1
+
+
+def test_failed_retry_renew_is_recorded_as_abandoned(tmp_path: Path) -> None:
+    pairs = _write_inputs(tmp_path, 1)
+    clock = FakeClock()
+    workspace = ShardWorkspace(tmp_path / "work", clock=clock)
+    (task,) = workspace.plan(pairs)
+    worker = ShardWorker(workspace, tmp_path, worker_id="slow")
+    lease = workspace.acquire(task.task_id, "slow", ttl_seconds=30)
+    original_holds = workspace.holds
+    checks = []
+
+    def lose_after_first_check(target):
+        checks.append(target)
+        return len(checks) == 1 and original_holds(target)
+
+    def fail(_task):
+        raise OSError("share unavailable")
+
+    workspace.holds = lose_after_first_check
+    worker._execute = fail
+    worker._process(task, lease)
+
+    assert worker.report.retried == []
+    assert worker.report.abandoned == [task.task_id]
+
+
+def test_write_result_error_leaves_lease_to_expire(tmp_path: Path, monkeypatch) -> None:
+    pairs = _write_inputs(tmp_path, 1)
+    clock = FakeClock()
+    workspace = ShardWorkspace(tmp_path / "work", clock=clock)
+    (task,) = workspace.plan(pairs)
+    monkeypatch.setattr(sharding.time, "sleep", clock.advance)
+    original_write = workspace.write_result
+    calls = []
+
+    def flaky_write(task_id, payload):
+        calls.append(task_id)
+        if len(calls) == 1:
+            raise OSError("stale NFS file handle")
+        return original_write(task_id, payload)
+
+    workspace.write_result = flaky_write
+    report = ShardWorker(workspace, tmp_path, worker_id="worker", lease_ttl=30, poll_interval=10).run()
+
+    assert report.abandoned == [task.task_id]
+    assert report.completed == [task.task_id]
+    assert workspace.load_results()[task.task_id]["status"] == "complete"
+
+
+def test_restarted_worker_keeps_earlier_shard_reports(tmp_path: Path) -> None:
+    pairs = _write_inputs(tmp_path, 2)
+    workspace = ShardWorkspace(tmp_path / "work")
+    first, second = workspace.plan(pairs)
+    assert workspace.write_result(second.task_id, {"status": "complete", "task_id": second.task_id})
+
+    ShardWorker(workspace, tmp_path, worker_id="worker", poll_interval=0).run()
+    ShardWorker(workspace, tmp_path, worker_id="worker", poll_interval=0).run()
+
+    reports = merge_shards(workspace)["shards"]
+    assert len(reports) == 2
+    assert [report["completed"] for report in reports if report["completed"]] == [[first.task_id]]
+
+
+def test_multiple_processes_share_work_directory(tmp_path: Path) -> None:
+    pairs = _write_inputs(tmp_path, 6)
+    work_dir = tmp_path / "work"
+    ShardWorkspace(work_dir).plan(pairs)
+    env = {**os.environ, "PYTHONPATH": str(SRC_PATH)}
+
+    workers = [
+        subprocess.Popen(
+            [
+                sys.executable, "-m", "automation.sharding", "work", str(work_dir),
+                "--base-path", str(tmp_path), "--worker-id", f"worker-{idx}", "--poll-interval", "0.05",
+            ],
+            env=env,
+            stdout=subprocess.DEVNULL,
+        )
+        for idx in range(3)
+    ]
+    assert all(worker.wait(timeout=60) == 0 for worker in workers)
+
+    report = merge_shards(ShardWorkspace(work_dir))
+
+    assert report["tasks"] == 6
+    assert report["completed"] == 6
+    assert report["missing"] == []
+    assert {shard["worker_id"] for shard in report["shards"]} == {"worker-0", "worker-1", "worker-2"}
+    completed = [task_id for shard in report["shards"] for task_id in shard["completed"]]
+    assert sorted(completed) == sorted(result["task_id"] for result in report["results"])
+    assert all(result["summary"]["seo"].keys() == {"youtube"} for result in report["results"])